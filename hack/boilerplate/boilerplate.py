@@ -17,11 +17,16 @@
 from __future__ import print_function
 
 import argparse
+import concurrent.futures
 import datetime
 import difflib
+import functools
 import glob
+import mmap
+import multiprocessing
 import os
 import re
+import shutil
 import sys
 import json
 
@@ -53,7 +58,17 @@ parser.add_argument(
 
 args = parser.parse_args()
 
-verbose_out = sys.stderr if args.verbose else open("/dev/null", "w")
+class _NullOut:
+    """Swallows verbose output without the fd and write() syscalls of /dev/null."""
+
+    def write(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+
+verbose_out = sys.stderr if args.verbose else _NullOut()
 
 default_skipped_dirs = ['Godeps', '.git', 'vendor', 'third_party', '_gopath', '_output']
 
@@ -61,25 +76,42 @@ default_skipped_dirs = ['Godeps', '.git', 'vendor', 'third_party', '_gopath', '_
 default_skipped_not_generated = []
 
 
-def get_refs():
+@functools.lru_cache(maxsize=None)
+def _load_refs(boilerplate_dir):
     refs = {}
 
-    for path in glob.glob(os.path.join(args.boilerplate_dir, "boilerplate.*.txt")):
+    for path in glob.glob(os.path.join(boilerplate_dir, "boilerplate.*.txt")):
         extension = os.path.basename(path).split(".")[1]
 
         ref_file = open(path, 'r')
-        ref = ref_file.read().splitlines()
+        # immutable tuples, so handing out the cached dict is safe
+        ref = tuple(ref_file.read().splitlines())
         ref_file.close()
         refs[extension] = ref
 
     return refs
 
 
-def is_generated_file(filename, data, regexs, files_to_skip):
+def get_refs():
+    return _load_refs(args.boilerplate_dir)
+
+
+def is_generated_file(filename, data, regexs, files_to_skip, marker_found=None):
+    # an exact basename entry is the common case and a single hash lookup
+    # on the frozenset main() builds; genuine path fragments fall back to
+    # the substring matching below
+    if os.path.basename(filename) in files_to_skip:
+        return False
     for d in files_to_skip:
         if d in filename:
             return False
 
+    # callers that already searched the whole file for the marker (e.g.
+    # with a bytes scan over an mmap'd file) pass their result in; data may
+    # only hold the file head and the marker can sit anywhere in the file
+    if marker_found is not None:
+        return marker_found
+
     p = regexs["generated"]
     return p.search(data)
 
@@ -106,17 +138,34 @@ def replace_specials(content, extension, regexs):
 
 
 def file_passes(filename, refs, regexs, not_generated_files_to_skip):
+    # the reference headers all sit at the top of a file, so decoding a few
+    # lines more than the longest reference is enough for the comparison;
+    # this avoids slurping whole generated files just to inspect their
+    # header. The generated-file marker however may sit anywhere in the
+    # file (doc comments mention it too), so it is searched over the whole
+    # map — a C-level bytes scan that needs no decode and no extra read
+    # syscalls.
+    max_ref_lines = max((len(ref) for ref in refs.values()), default=0)
+    head_bytes = (max_ref_lines + 20) * 200  # generous bound per header line
     try:
-        f = open(filename, 'r')
+        with open(filename, 'rb') as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = mm[:head_bytes].decode('utf-8', 'replace')
+                    marker_found = mm.find(GENERATED_MARKER.encode()) >= 0
+            except ValueError:
+                # empty files cannot be mapped; mirror the mmap branch and
+                # search the full content for the marker
+                raw = f.read()
+                data = raw[:head_bytes].decode('utf-8', 'replace')
+                marker_found = GENERATED_MARKER.encode() in raw
     except Exception as exc:
         print("Unable to open %s: %s" % (filename, exc), file=verbose_out)
         return False
 
-    data = f.read()
-    f.close()
-
     ref, extension, generated = analyze_file(
-        filename, data, refs, regexs, not_generated_files_to_skip)
+        filename, data, refs, regexs, not_generated_files_to_skip,
+        marker_found=marker_found)
 
     return file_content_passes(data, filename, ref, extension, generated, regexs)
 
@@ -139,25 +188,27 @@ def file_content_passes(data, filename, ref, extension, generated, regexs):
     # trim our file to the same number of lines as the reference file
     data = data[:len(ref)]
 
-    p = regexs["year"]
-    for d in data:
-        if p.search(d):
+    # one pass over the header: reject a literal YEAR field and, for
+    # non-generated files, replace the first date
+    # ("2014|2015|2016|2017|2018|...") with "YEAR"
+    year = regexs["year"]
+    date = regexs["date"]
+    date_replaced = generated
+    for i, d in enumerate(data):
+        if year.search(d):
             if generated:
                 print('File %s has the YEAR field, but it should not be in generated file' % filename, file=verbose_out)
             else:
                 print('File %s has the YEAR field, but missing the year of date' % filename, file=verbose_out)
             return False
 
-    if not generated:
-        # Replace all occurrences of the regex "2014|2015|2016|2017|2018" with "YEAR"
-        p = regexs["date"]
-        for i, d in enumerate(data):
-            (data[i], found) = p.subn('YEAR', d)
+        if not date_replaced:
+            (data[i], found) = date.subn('YEAR', d)
             if found != 0:
-                break
+                date_replaced = True
 
     # if we don't match the reference at this point, fail
-    if ref != data:
+    if list(ref) != data:
         print("Header in %s does not match reference, diff:" % filename, file=verbose_out)
         if args.verbose:
             print(file=verbose_out)
@@ -184,8 +235,14 @@ def read_config_file(conf_path):
 
 
 def normalize_files(files, dirs_to_skip):
+    dirs_to_skip = dirs_to_skip or ()
+    skipped_names = frozenset(dirs_to_skip)
     newfiles = []
     for pathname in files:
+        # plain directory names are caught by an O(1) lookup against the
+        # path components; fragment entries keep the substring semantics
+        if skipped_names.intersection(pathname.split(os.sep)):
+            continue
         if any(x in pathname for x in dirs_to_skip):
             continue
         newfiles.append(pathname)
@@ -195,38 +252,51 @@ def normalize_files(files, dirs_to_skip):
     return newfiles
 
 
+def iter_files(root, skipped_dirs, extensions):
+    # os.scandir exposes the entry type straight from the directory listing,
+    # so classifying entries and skipping pruned dirs needs no extra stat()
+    # per file the way os.walk's bookkeeping does
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                # don't visit certain dirs. This is just a performance
+                # improvement as we would prune these later in
+                # normalize_files(). But doing it here stops the walk from
+                # ever descending into them
+                if entry.name not in skipped_dirs:
+                    for pathname in iter_files(entry.path, skipped_dirs, extensions):
+                        yield pathname
+            # check the extension before materializing the path, so files
+            # we would discard anyway are never listed
+            elif file_extension(entry.name) in extensions or entry.name in extensions:
+                yield entry.path
+
+
 def get_files(extensions, dirs_to_skip):
-    files = []
+    extensions = set(extensions)
+
     if len(args.filenames) > 0:
-        files = args.filenames
-    else:
-        for root, dirs, walkfiles in os.walk(args.rootdir):
-            # don't visit certain dirs. This is just a performance improvement
-            # as we would prune these later in normalize_files(). But doing it
-            # cuts down the amount of filesystem walking we do and cuts down
-            # the size of the file list
-            for d in dirs_to_skip:
-                if d in dirs:
-                    dirs.remove(d)
-
-            for name in walkfiles:
-                pathname = os.path.join(root, name)
-                files.append(pathname)
-
-    files = normalize_files(files, dirs_to_skip)
-    outfiles = []
-    for pathname in files:
-        basename = os.path.basename(pathname)
-        extension = file_extension(pathname)
-        if extension in extensions or basename in extensions:
-            outfiles.append(pathname)
-    return outfiles
+        outfiles = []
+        for pathname in normalize_files(args.filenames, dirs_to_skip):
+            basename = os.path.basename(pathname)
+            if file_extension(pathname) in extensions or basename in extensions:
+                outfiles.append(pathname)
+        return outfiles
+
+    files = list(iter_files(args.rootdir, set(dirs_to_skip or ()), extensions))
+    return normalize_files(files, dirs_to_skip)
 
 
-def analyze_file(file_name, file_content, refs, regexs, not_generated_files_to_skip):
+def analyze_file(file_name, file_content, refs, regexs, not_generated_files_to_skip,
+                 marker_found=None):
     # determine if the file is automatically generated
     generated = is_generated_file(
-        file_name, file_content, regexs, not_generated_files_to_skip)
+        file_name, file_content, regexs, not_generated_files_to_skip,
+        marker_found)
 
     base_name = os.path.basename(file_name)
     if generated:
@@ -243,36 +313,43 @@ def analyze_file(file_name, file_content, refs, regexs, not_generated_files_to_s
 
 
 def ensure_boilerplate_file(file_name, refs, regexs, not_generated_files_to_skip):
-    with open(file_name, mode='r+') as f:
+    with open(file_name, mode='r') as f:
         file_content = f.read()
 
-        ref, extension, generated = analyze_file(
-            file_name, file_content, refs, regexs, not_generated_files_to_skip)
+    ref, extension, generated = analyze_file(
+        file_name, file_content, refs, regexs, not_generated_files_to_skip)
 
-        # licence header
-        licence_header = os.linesep.join(ref)
+    # licence header
+    licence_header = os.linesep.join(ref)
 
-        # content without shebang and such
-        content_without_specials, special_header = replace_specials(
-            file_content, extension, regexs)
+    # content without shebang and such
+    content_without_specials, special_header = replace_specials(
+        file_content, extension, regexs)
 
-        # new content, to be writen to the file
-        new_content = ''
+    # new content, to be writen to the file
+    new_content = ''
 
-        # shebang and such
-        if special_header is not None:
-            new_content += special_header
+    # shebang and such
+    if special_header is not None:
+        new_content += special_header
 
-        # licence header
-        current_year = str(datetime.datetime.now().year)
-        year_replacer = regexs['year']
-        new_content += year_replacer.sub(current_year, licence_header, 1)
+    # licence header
+    current_year = str(datetime.datetime.now().year)
+    year_replacer = regexs['year']
+    new_content += year_replacer.sub(current_year, licence_header, 1)
 
-        # actual content
-        new_content += os.linesep + content_without_specials
+    # actual content
+    new_content += os.linesep + content_without_specials
 
-        f.seek(0)
+    # write to a sibling temp file and rename it over the original: the
+    # previous in-place seek+write could leave stale bytes behind whenever
+    # the new content came out shorter, and the rename swaps the file in
+    # atomically
+    tmp_name = file_name + '.tmp'
+    with open(tmp_name, mode='w') as f:
         f.write(new_content)
+    shutil.copymode(file_name, tmp_name)
+    os.replace(tmp_name, file_name)
 
 
 def get_dates():
@@ -280,21 +357,28 @@ def get_dates():
     return '(%s)' % '|'.join((str(year) for year in range(2014, years+1)))
 
 
-def get_regexs():
-    regexs = {}
+# files carrying this marker anywhere in their content are considered
+# generated
+GENERATED_MARKER = 'DO NOT EDIT'
+
+# compile the patterns once at import instead of on every get_regexs() call
+_regexs = {
     # Search for "YEAR" which exists in the boilerplate, but shouldn't in the real thing
-    regexs["year"] = re.compile('YEAR')
+    "year": re.compile('YEAR'),
     # get_dates return 2014, 2015, 2016, 2017, or 2018 until the current year as a regex like: "(2014|2015|2016|2017|2018)";
     # company holder names can be anything
-    regexs["date"] = re.compile(get_dates())
+    "date": re.compile(get_dates()),
     # strip // +build \n\n build constraints
-    regexs["go_build_constraints"] = re.compile(
-        r"^(// \+build.*\n)+\n", re.MULTILINE)
+    "go_build_constraints": re.compile(r"^(// \+build.*\n)+\n", re.MULTILINE),
     # strip #!.* from shell scripts
-    regexs["shebang"] = re.compile(r"^(#!.*\n)\n*", re.MULTILINE)
+    "shebang": re.compile(r"^(#!.*\n)\n*", re.MULTILINE),
     # Search for generated files
-    regexs["generated"] = re.compile('DO NOT EDIT')
-    return regexs
+    "generated": re.compile(GENERATED_MARKER),
+}
+
+
+def get_regexs():
+    return _regexs
 
 
 def main():
@@ -304,10 +388,21 @@ def main():
     regexs = get_regexs()
     refs = get_refs()
     filenames = get_files(refs.keys(), config.get('dirs_to_skip'))
-    not_generated_files_to_skip = config.get('not_generated_files_to_skip', [])
-
-    for filename in filenames:
-        if not file_passes(filename, refs, regexs, not_generated_files_to_skip):
+    not_generated_files_to_skip = frozenset(
+        config.get('not_generated_files_to_skip', []))
+
+    # checking one file is independent of all others and mostly I/O plus
+    # regex matching, so fan the checks out across cores; the fork context
+    # hands the parsed args and loaded refs to the workers as-is
+    check = functools.partial(
+        file_passes, refs=refs, regexs=regexs,
+        not_generated_files_to_skip=not_generated_files_to_skip)
+    with concurrent.futures.ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("fork")) as executor:
+        results = list(executor.map(check, filenames, chunksize=32))
+
+    for filename, passes in zip(filenames, results):
+        if not passes:
             if args.ensure:
                 print("adding boilerplate header to %s" % filename)
                 ensure_boilerplate_file(